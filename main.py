@@ -4,9 +4,14 @@ import asyncio
 import logging
 import re
 import html
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass
 import requests  # добавил импорт
+from requests.adapters import HTTPAdapter
 from datetime import datetime
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Union, NamedTuple
 from telethon import TelegramClient
 from dotenv import load_dotenv
 
@@ -15,12 +20,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SESSION_NAME = os.path.join(BASE_DIR, "session")
 SESSION_FILE = f"{SESSION_NAME}.session"
 STATE_FILE = os.path.join(BASE_DIR, "bot_state.json")
-
-if os.path.exists(SESSION_FILE):
-    os.chmod(SESSION_FILE, 0o600)  # правильные права доступа
-
-
-load_dotenv()
+STATE_DB_FILE = os.path.join(BASE_DIR, "bot_state.db")
 
 
 # Настройка логирования
@@ -30,12 +30,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Конфигурация из переменных окружения
-api_id = int(os.environ.get("API_ID"))
-api_hash = os.environ.get("API_HASH")
-phone_number = os.environ.get("PHONE_NUMBER")
-my_user_id = int(os.environ.get("MY_USER_ID"))
-bot_token = os.environ.get("BOT_TOKEN")  # добавил токен бота
+
+@dataclass
+class Config:
+    """Конфигурация из переменных окружения"""
+
+    api_id: int
+    api_hash: str
+    phone_number: str
+    my_user_id: int
+    bot_token: Optional[str]
+    # Хранилище состояния: "json" (bot_state.json) или "sqlite" (bot_state.db)
+    state_backend: str = "json"
+    # Пауза между циклами в секундах; 0 (или MONITOR_INTERVAL не задан) — один
+    # цикл и выход, как в GitHub Actions
+    monitor_interval: int = 0
+
+
+def _load_config() -> Config:
+    """Читает конфигурацию (.env + окружение); падает сразу, если чего-то не хватает"""
+    load_dotenv()
+
+    raw_interval = os.environ.get("MONITOR_INTERVAL")
+    monitor_interval = int(raw_interval) if raw_interval else 0
+    # 0 — один цикл; отрицательный интервал дал бы цикл без пауз между проходами
+    if monitor_interval < 0:
+        raise ValueError(f"MONITOR_INTERVAL must not be negative, got {monitor_interval}")
+
+    # Опечатка в имени хранилища не должна молча оставлять JSON
+    state_backend = os.environ.get("STATE_BACKEND") or "json"
+    if state_backend not in ("json", "sqlite"):
+        raise ValueError(f"STATE_BACKEND must be 'json' or 'sqlite', got {state_backend!r}")
+
+    return Config(
+        api_id=int(os.environ["API_ID"]),
+        api_hash=os.environ["API_HASH"],
+        phone_number=os.environ["PHONE_NUMBER"],
+        my_user_id=int(os.environ["MY_USER_ID"]),
+        bot_token=os.environ.get("BOT_TOKEN"),
+        state_backend=state_backend,
+        monitor_interval=monitor_interval,
+    )
+
 
 # Каналы для мониторинга
 CHANNELS = [
@@ -46,6 +82,9 @@ CHANNELS = [
     "nachemodanah",
 ]
 
+# Сколько каналов опрашиваем одновременно (чтобы не упереться в flood-лимиты MTProto)
+CHANNEL_CONCURRENCY = 3
+
 # ========== НАСТРОЙКИ ПОИСКА ==========
 # Города вылета
 DEPARTURE_CITIES = [
@@ -65,9 +104,29 @@ DEPARTURE_CITIES = [
 
 # Явное указание вылета "не из Москвы" должно исключать сообщение.
 # Если вылет не указан — сообщение допускаем.
+# Все паттерны ниже применяются к тексту в нижнем регистре, поэтому
+# литералы тоже приводим к нижнему регистру и обходимся без re.IGNORECASE.
 MOSCOW_DEPARTURE_PATTERN = re.compile(
-    r"(?<!\w)(" + "|".join(re.escape(x) for x in DEPARTURE_CITIES) + r")(?!\w)",
-    re.IGNORECASE,
+    r"(?<!\w)(" + "|".join(re.escape(x.lower()) for x in DEPARTURE_CITIES) + r")(?!\w)"
+)
+
+# Строка "вылет из ..." и кандидаты в город после неё
+_DEPARTURE_RE = re.compile(r"(?:вылет|departure)\s*(?:из|from)\s*[:\-]?\s*(.*)$")
+_HASHTAG_CITY_RE = re.compile(r"#([a-zа-яё][\w\-]{2,})")
+_WORD_CITY_RE = re.compile(r"[a-zа-яё][a-zа-яё\-]{2,}")
+
+# Слова после "вылет из", которые не являются городом
+_DEPARTURE_STOPWORDS = frozenset(
+    {
+        "перелетотель",
+        "перелётотель",
+        "перелет",
+        "перелёт",
+        "отель",
+        "тур",
+        "туры",
+        "сибирь",
+    }
 )
 
 # Направления - ТОЛЬКО ПОЛНЫЕ СЛОВА!
@@ -87,8 +146,40 @@ DESTINATIONS = [
     r"\bccj\b",
 ]
 
-# Составляем общий паттерн для поиска
-DEST_PATTERN = re.compile("|".join(DESTINATIONS), re.IGNORECASE)
+# Те же направления (заданы в нижнем регистре) как простые подстроки —
+# для дешёвого префильтра перед регулярками (str.__contains__ намного быстрее re.search).
+# "delhi" отдельно не нужен: его покрывает подстрока "del"
+_DEST_LITERALS = (
+    "индия",
+    "india",
+    "гоа",
+    "goa",
+    "дели",
+    "del",
+    "мумбаи",
+    "mumbai",
+    "bom",
+    "кожикоде",
+    "calicut",
+    "ccj",
+)
+
+# Исключаем круизы
+EXCLUDE_KEYWORDS = [
+    "круиз",
+    "круизы",
+    "cruise",
+    "корабль",
+    "ship",
+    "теплоход",
+]
+
+# Направления и стоп-слова одной альтернацией: один проход по тексту
+# вместо отдельного поиска направлений и перебора стоп-слов
+_KEYWORDS_RE = re.compile(
+    r"(?P<dest>" + "|".join(DESTINATIONS) + r")"
+    r"|(?P<exclude>" + "|".join(re.escape(k.lower()) for k in EXCLUDE_KEYWORDS) + r")"
+)
 
 # Целевой месяц - МАРТ 2026
 TARGET_MONTH = 3
@@ -101,6 +192,50 @@ SEND_IF_NO_DATE = True
 MIN_TEXT_LENGTH = 50
 # =====================================
 
+# Названия месяцев (префиксы) -> номер месяца.
+# "май" засчитывается только как упоминание месяца: датой с днём считаем лишь
+# "10 мая" — иначе "10 майских" или "12 май" превратились бы в майскую дату
+_MONTH_MAP = {
+    "январ": 1,
+    "феврал": 2,
+    "март": 3,
+    "апрел": 4,
+    "мая": 5,
+    "май": 5,
+    "июн": 6,
+    "июл": 7,
+    "август": 8,
+    "сентябр": 9,
+    "октябр": 10,
+    "ноябр": 11,
+    "декабр": 12,
+}
+
+# Все форматы дат одной альтернацией с именованными группами — один проход по тексту:
+#   dmy — ДД.ММ.ГГ(ГГ), dm — ДД.ММ,
+#   mon — "5 марта" или просто упоминание месяца (день необязателен)
+_DATES_RE = re.compile(
+    r"(?P<dmy>(?P<dmy_d>\d{1,2})[./](?P<dmy_m>\d{1,2})[./](?P<dmy_y>\d{2,4}))"
+    r"|(?P<dm>(?P<dm_d>\d{1,2})[./](?P<dm_m>\d{1,2})(?![./\d]))"
+    r"|(?P<mon>(?:(?P<mon_d>\d{1,2})\s+)?(?P<mon_name>" + "|".join(_MONTH_MAP) + r")[а-я]*)"
+)
+
+# Числовая дата в самом простом виде — для быстрой проверки "есть ли даты вообще"
+_NUMERIC_DATE_RE = re.compile(r"\d[./]\d")
+
+# Любая цена из _PRICE_RE — это цифра, за которой (через пробелы) идёт
+# валюта: "р"/"руб" (кириллица), "₽" или латинская "p". Без такого места
+# в тексте паттерн цены заведомо ничего не найдёт.
+_PRICE_HINT_RE = re.compile(r"\d\s*[р₽p]")
+
+# Цена одним паттерном (текст в нижнем регистре): "1.500 руб", "за 2,000р.",
+# "3.000 ₽" — группа 1; "60500P" (латинская P, так часто пишут в каналах) — группа 2.
+# После числа достаточно первой буквы валюты: "руб" начинается с той же "р"
+_PRICE_RE = re.compile(
+    r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*[р₽]"
+    r"|(\d{4,6})\s*p\b"
+)
+
 # Файл для хранения состояния
 # =====================================
 
@@ -116,41 +251,97 @@ def clean_channel(channel):
     return channel
 
 
-def send_telegram_message(text: str) -> bool:
-    """Отправляет сообщение через бота"""
-    if not bot_token:
-        logger.error("BOT_TOKEN not set")
-        return False
+# Одна HTTP-сессия на процесс: keep-alive вместо нового TLS-рукопожатия на каждое сообщение
+_TG_SESSION = requests.Session()
+_TG_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+
+# Сколько раз пробуем отправить сообщение при ответе 429 (Too Many Requests)
+SEND_MAX_ATTEMPTS = 3
 
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
 
-    payload = {
-        "chat_id": my_user_id,
+def _message_payload(chat_id: int, text: str) -> Dict[str, Any]:
+    """Тело запроса sendMessage"""
+    return {
+        "chat_id": chat_id,
         "text": text,
         # HTML-режим проще и надёжнее: не ломает ссылки из-за `_` в URL
         "parse_mode": "HTML",
         "disable_web_page_preview": True,
     }
 
-    try:
-        response = requests.post(url, json=payload, timeout=10)
+
+async def send_telegram_message(config: Config, text: str) -> bool:
+    """Отправляет сообщение через бота, не блокируя event loop; на 429 ждёт retry_after"""
+    if not config.bot_token:
+        logger.error("BOT_TOKEN not set")
+        return False
+
+    url = f"https://api.telegram.org/bot{config.bot_token}/sendMessage"
+    payload = _message_payload(config.my_user_id, text)
+
+    for attempt in range(SEND_MAX_ATTEMPTS):
+        try:
+            # requests блокирующий — выносим запрос в поток, чтобы не тормозить Telethon
+            response = await asyncio.to_thread(
+                _TG_SESSION.post, url, json=payload, timeout=10
+            )
+        except Exception as e:
+            logger.error(f"Error sending message via bot: {e}")
+            return False
+
         if response.status_code == 200:
             logger.info("Message sent via bot")
             return True
-        else:
-            logger.error(f"Failed to send message: {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"Error sending message via bot: {e}")
+
+        if response.status_code == 429:
+            try:
+                retry_after = response.json()["parameters"]["retry_after"]
+            except Exception:  # noqa: BLE001
+                retry_after = 1
+            # После последней попытки ждать уже нечего
+            if attempt < SEND_MAX_ATTEMPTS - 1:
+                logger.warning(f"Bot API rate limit hit, retrying in {retry_after}s")
+                await asyncio.sleep(retry_after)
+            continue
+
+        logger.error(f"Failed to send message: {response.text}")
         return False
 
+    logger.error("Failed to send message: rate limit retries exhausted")
+    return False
+
+
+async def send_telegram_messages(config: Config, texts: List[str]) -> int:
+    """Отправляет пачку сообщений по очереди; возвращает число успешных"""
+    # Все сообщения идут в один чат, а там лимит Telegram ~1 msg/sec —
+    # параллельная отправка только собирает 429 и теряет совпадения
+    sent = 0
+    for text in texts:
+        if await send_telegram_message(config, text):
+            sent += 1
+    return sent
+
 
 class FileState:
     """Управление состоянием в файле"""
 
+    # Храним последние 100 ID чтобы не разрастался файл
+    MAX_PROCESSED_IDS = 100
+
     def __init__(self, state_file: str):
         self.state_file = state_file
         self.state = self._load()
+        # Есть ли изменения, ещё не записанные в файл
+        self._dirty = False
+
+        # В памяти: очередь последних ID (для обрезки) + множество (для O(1) проверки)
+        self._processed: Dict[str, deque] = {}
+        self._processed_sets: Dict[str, set] = {}
+        for channel, data in self.state.items():
+            ids = data.get("processed_ids", [])
+            self._processed[channel] = deque(ids, maxlen=self.MAX_PROCESSED_IDS)
+            self._processed_sets[channel] = set(self._processed[channel])
 
     def _load(self) -> Dict:
         """Загружает состояние из файла"""
@@ -165,185 +356,276 @@ class FileState:
 
     def _save(self):
         """Сохраняет состояние в файл"""
-        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
         tmp_file = f"{self.state_file}.tmp"
         with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(self.state, f, indent=2, ensure_ascii=False)
         os.replace(tmp_file, self.state_file)
 
+    def flush(self):
+        """Записывает накопленные изменения в файл (один раз на канал)"""
+        if not self._dirty:
+            return
+        for channel, processed in self._processed.items():
+            self.state.setdefault(channel, {})["processed_ids"] = list(processed)
+        self._save()
+        self._dirty = False
+
+    def close(self):
+        """Сохраняет несохранённое перед выходом"""
+        self.flush()
+
     def get_last_id(self, channel: str) -> int:
         """Получить последний обработанный ID"""
         return self.state.get(channel, {}).get("last_id", 0)
 
     def set_last_id(self, channel: str, message_id: int):
-        """Сохранить последний ID"""
+        """Сохранить последний ID (в файл попадёт при flush)"""
         if channel not in self.state:
             self.state[channel] = {}
         self.state[channel]["last_id"] = message_id
         self.state[channel]["last_check"] = datetime.now().isoformat()
-        self._save()
+        self._dirty = True
 
     def is_duplicate(self, channel: str, message_id: int) -> bool:
         """Проверка на дубликат (храним последние 100 ID)"""
-        if channel not in self.state:
-            return False
-        processed = self.state[channel].get("processed_ids", [])
-        return message_id in processed
+        return message_id in self._processed_sets.get(channel, ())
 
     def mark_processed(self, channel: str, message_id: int):
-        """Отметить сообщение как обработанное"""
-        if channel not in self.state:
-            self.state[channel] = {}
-
-        # Храним последние 100 ID чтобы не разрастался файл
-        processed = self.state[channel].get("processed_ids", [])
+        """Отметить сообщение как обработанное (в файл попадёт при flush)"""
+        if channel not in self._processed:
+            self._processed[channel] = deque(maxlen=self.MAX_PROCESSED_IDS)
+            self._processed_sets[channel] = set()
+
+        processed = self._processed[channel]
+        processed_set = self._processed_sets[channel]
+        if message_id in processed_set:
+            return
+
+        # Самый старый ID вытесняется из очереди — убираем его и из множества
+        if len(processed) == processed.maxlen:
+            processed_set.discard(processed[0])
         processed.append(message_id)
-        # Оставляем только последние 100
-        if len(processed) > 100:
-            processed = processed[-100:]
-        self.state[channel]["processed_ids"] = processed
-        self._save()
+        processed_set.add(message_id)
+        self._dirty = True
+
+
+class SqliteState:
+    """Управление состоянием в SQLite (WAL): запись O(1) на обновление вместо перезаписи файла"""
+
+    # Сколько храним ID обработанных сообщений (вместо обрезки до 100 штук)
+    PROCESSED_TTL_SECONDS = 7 * 24 * 60 * 60
+
+    def __init__(self, db_file: str, seed_file: Optional[str] = None):
+        self.db_file = db_file
+        # isolation_level=None — транзакциями управляем сами (BEGIN/COMMIT)
+        self.conn = sqlite3.connect(db_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS last_id (
+                channel TEXT PRIMARY KEY,
+                id INTEGER NOT NULL,
+                last_check TEXT
+            );
+            CREATE TABLE IF NOT EXISTS processed (
+                channel TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                PRIMARY KEY (channel, id)
+            );
+            CREATE INDEX IF NOT EXISTS processed_ts ON processed (ts);
+            """
+        )
+        if seed_file:
+            self._seed_from_json(seed_file)
 
+    def _seed_from_json(self, state_file: str):
+        """
+        При первом запуске переносит состояние из bot_state.json,
+        иначе все last_id начнутся с 0 и бот заново пришлёт свежие посты
+        """
+        if self.conn.execute("SELECT 1 FROM last_id LIMIT 1").fetchone():
+            return
+
+        legacy = FileState(state_file).state
+        if not legacy:
+            return
+
+        now = int(time.time())
+        self._begin()
+        for channel, data in legacy.items():
+            if "last_id" in data:
+                self.conn.execute(
+                    "INSERT INTO last_id (channel, id, last_check) VALUES (?, ?, ?)",
+                    (channel, data["last_id"], data.get("last_check")),
+                )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed (channel, id, ts) VALUES (?, ?, ?)",
+                [(channel, i, now) for i in data.get("processed_ids", [])],
+            )
+        self.flush()
+        logger.info(f"Imported state for {len(legacy)} channels from {state_file}")
 
-class FlightSearchAnalyzer:
-    """Анализатор сообщений на наличие билетов в Индию"""
+    def _begin(self):
+        """Открывает транзакцию, если она ещё не открыта"""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
 
-    def __init__(self):
-        self.date_patterns = [
-            r"(\d{1,2})[./](\d{1,2})[./](\d{2,4})",
-            r"(\d{1,2})[./](\d{1,2})(?![./\d])",
-            r"(\d{1,2})\s+(марта?|мар|march?|mar)\b",
-            r"(март|march|mar)\s+(\d{1,2})\b",
-        ]
+    def flush(self):
+        """
+        Фиксирует накопленные изменения и чистит устаревшие ID.
+        Соединение и транзакция общие для всех каналов: каналы опрашиваются
+        параллельно, поэтому flush одного канала фиксирует и уже сделанные
+        записи остальных. Это безопасно — так же ведёт себя и FileState:
+        last_id канала пишется только после обработки всех его сообщений,
+        а отметки обработанных ID не дают повторно отправить совпадения.
+        """
+        if not self.conn.in_transaction:
+            return
+        self.conn.execute(
+            "DELETE FROM processed WHERE ts < ?",
+            (int(time.time()) - self.PROCESSED_TTL_SECONDS,),
+        )
+        self.conn.execute("COMMIT")
 
-        self.price_patterns = [
-            r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s?(?:руб|р\.?|₽)\b",
-            r"за\s+(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*(?:руб|р\.?|₽)",
-            r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*р(?!уб)",
-            # Часто в каналах цена пишется как "60500P" (латинская P)
-            r"(\d{4,6})\s*[pP]\b",
-        ]
+    def close(self):
+        """Фиксирует несохранённое и закрывает соединение с базой"""
+        self.flush()
+        self.conn.close()
 
-        self.has_date_pattern = re.compile(
-            r"\d{1,2}[./]\d{1,2}|\d{1,2}\s+(мар|апр|май|июн|июл|авг|сен|окт|ноя|дек)|(янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|дек)\s+\d{1,2}",
-            re.IGNORECASE,
+    def get_last_id(self, channel: str) -> int:
+        """Получить последний обработанный ID"""
+        row = self.conn.execute(
+            "SELECT id FROM last_id WHERE channel = ?", (channel,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_last_id(self, channel: str, message_id: int):
+        """Сохранить последний ID (зафиксируется при flush)"""
+        self._begin()
+        self.conn.execute(
+            "INSERT INTO last_id (channel, id, last_check) VALUES (?, ?, ?) "
+            "ON CONFLICT(channel) DO UPDATE SET id = excluded.id, last_check = excluded.last_check",
+            (channel, message_id, datetime.now().isoformat()),
         )
 
-    def has_india_destination(self, text: str) -> bool:
-        """Проверяет наличие Индии/Гоа"""
-        if not text:
-            return False
-        return bool(DEST_PATTERN.search(text))
+    def is_duplicate(self, channel: str, message_id: int) -> bool:
+        """Проверка на дубликат"""
+        row = self.conn.execute(
+            "SELECT 1 FROM processed WHERE channel = ? AND id = ?",
+            (channel, message_id),
+        ).fetchone()
+        return row is not None
 
-    def extract_dates(self, text: str) -> List[Dict]:
-        """Извлекает даты из текста"""
-        dates_info = []
-        if not text:
-            return dates_info
+    def mark_processed(self, channel: str, message_id: int):
+        """Отметить сообщение как обработанное (зафиксируется при flush)"""
+        self._begin()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO processed (channel, id, ts) VALUES (?, ?, ?)",
+            (channel, message_id, int(time.time())),
+        )
 
-        text_lower = text.lower()
 
-        # Формат ДД.ММ.ГГ
-        for match in re.finditer(r"(\d{1,2})[./](\d{1,2})[./](\d{2,4})", text):
-            day, month, year = match.groups()
-            day, month = int(day), int(month)
+State = Union[FileState, SqliteState]
 
-            if len(year) == 2:
-                year = 2000 + int(year)
-            else:
-                year = int(year)
-
-            if 1 <= month <= 12 and 1 <= day <= 31:
-                dates_info.append(
-                    {
-                        "day": day,
-                        "month": month,
-                        "year": year,
-                        "full_date": datetime(year, month, day),
-                    }
-                )
 
-        # Формат ДД.ММ
-        for match in re.finditer(r"(\d{1,2})[./](\d{1,2})(?![./\d])", text):
-            day, month = match.groups()
-            day, month = int(day), int(month)
-            if 1 <= month <= 12 and 1 <= day <= 31:
-                dates_info.append(
-                    {
-                        "day": day,
-                        "month": month,
-                        "year": TARGET_YEAR,
-                        "full_date": datetime(TARGET_YEAR, month, day),
-                    }
-                )
+class DateInfo(NamedTuple):
+    """Дата, найденная в тексте"""
+
+    day: int
+    month: int
+    year: int
 
-        # Формат "5 марта"
-        months_ru = {
-            "январ": 1,
-            "феврал": 2,
-            "март": 3,
-            "апрел": 4,
-            "мая": 5,
-            "июн": 6,
-            "июл": 7,
-            "август": 8,
-            "сентябр": 9,
-            "октябр": 10,
-            "ноябр": 11,
-            "декабр": 12,
-        }
 
-        for month_name, month_num in months_ru.items():
-            pattern = rf"(\d{{1,2}})\s+{month_name}[а-я]*"
-            for match in re.finditer(pattern, text_lower):
-                day = int(match.group(1))
-                if 1 <= day <= 31:
-                    dates_info.append(
-                        {
-                            "day": day,
-                            "month": month_num,
-                            "year": TARGET_YEAR,
-                            "full_date": datetime(TARGET_YEAR, month_num, day),
-                        }
-                    )
-
-        # Убираем дубликаты
-        unique_dates = []
+class FlightSearchAnalyzer:
+    """Анализатор сообщений на наличие билетов в Индию"""
+
+    def _scan_keywords(self, text_lower: str) -> Tuple[List[str], bool]:
+        """Один проход по тексту: найденные направления и наличие стоп-слов"""
+        destinations = set()
+        excluded = False
+        for m in _KEYWORDS_RE.finditer(text_lower):
+            if m.lastgroup == "dest":
+                destinations.add(m.group())
+            else:
+                excluded = True
+        return list(destinations), excluded
+
+    def has_any_date(self, text_lower: str) -> bool:
+        """Быстрая проверка: есть ли в тексте название месяца или числовая дата"""
+        # Названия месяцев — чистые литералы, str.__contains__ быстрее регулярки
+        if any(name in text_lower for name in _MONTH_MAP):
+            return True
+        return bool(_NUMERIC_DATE_RE.search(text_lower))
+
+    def scan_dates(self, text_lower: str) -> Tuple[List[DateInfo], List[int]]:
+        """Один проход по тексту: уникальные даты и упомянутые месяцы"""
+        dates_info = []
+        months = []
         seen = set()
-        for d in dates_info:
-            key = f"{d.get('day')}-{d.get('month')}-{d.get('year')}"
-            if key not in seen and d.get("day") and d.get("month"):
-                seen.add(key)
-                unique_dates.append(d)
 
-        return unique_dates
+        # Без месяцев и цифр через точку/слэш _DATES_RE ничего не найдёт
+        if not self.has_any_date(text_lower):
+            return dates_info, months
+
+        for match in _DATES_RE.finditer(text_lower):
+            kind = match.lastgroup
+            if kind == "dmy":
+                # Формат ДД.ММ.ГГ
+                day, month = int(match.group("dmy_d")), int(match.group("dmy_m"))
+                year = match.group("dmy_y")
+                year = 2000 + int(year) if len(year) == 2 else int(year)
+            elif kind == "dm":
+                # Формат ДД.ММ
+                day, month = int(match.group("dm_d")), int(match.group("dm_m"))
+                year = TARGET_YEAR
+            else:
+                # Формат "5 марта" / упоминание месяца
+                month = _MONTH_MAP[match.group("mon_name")]
+                if month not in months:
+                    months.append(month)
+                if match.group("mon_d") is None or match.group("mon_name") == "май":
+                    continue
+                day, year = int(match.group("mon_d")), TARGET_YEAR
+
+            if not (1 <= month <= 12 and 1 <= day <= 31):
+                continue
 
-    def extract_price(self, text: str) -> Optional[int]:
-        """Извлекает цену из текста"""
-        if not text:
+            # Убираем дубликаты сразу при добавлении
+            date = DateInfo(day, month, year)
+            if date in seen:
+                continue
+            seen.add(date)
+            dates_info.append(date)
+
+        return dates_info, months
+
+    def extract_price(self, text_lower: str) -> Optional[int]:
+        """Извлекает цену из текста (в нижнем регистре)"""
+        if not text_lower or not _PRICE_HINT_RE.search(text_lower):
             return None
 
-        prices = []
-        for pattern in self.price_patterns:
-            for match in re.finditer(pattern, text, re.IGNORECASE):
-                price_str = match.group(1)
-                price_str = re.sub(r"\s+", "", price_str)
-                price_str = price_str.replace(",", ".").replace(" ", "")
-
-                try:
-                    if "." in price_str:
-                        price = int(float(price_str))
-                    else:
-                        price = int(price_str)
-
-                    if 1000 <= price <= 500000:
-                        prices.append(price)
-                except ValueError:
-                    continue
+        # Обычно цена в сообщении одна — держим минимум, а не копим список
+        best = None
+        for match in _PRICE_RE.finditer(text_lower):
+            # В группе только цифры и разделители — пробелов там не бывает
+            price_str = (match.group(1) or match.group(2)).replace(",", ".")
+
+            try:
+                if "." in price_str:
+                    price = int(float(price_str))
+                else:
+                    price = int(price_str)
+
+                if 1000 <= price <= 500000 and (best is None or price < best):
+                    best = price
+            except ValueError:
+                continue
 
-        return min(prices) if prices else None
+        return best
 
-    def _detect_departure(self, text: str) -> Dict[str, Any]:
+    def _detect_departure(self, text_lower: str) -> Dict[str, Any]:
         """
         Определяет, указан ли вылет, и из Москвы ли он.
         Правило:
@@ -351,23 +633,12 @@ class FlightSearchAnalyzer:
         - если указан из Москвы -> допускаем
         - если вылет не указан -> допускаем
         """
-        if not text:
+        # Про вылет в тексте ни слова — не режем на строки и не гоняем регулярки
+        if "вылет" not in text_lower and "departure" not in text_lower:
             return {"explicit": False, "is_moscow": None, "value": None}
 
-        stopwords = {
-            "перелетотель",
-            "перелётотель",
-            "перелет",
-            "перелёт",
-            "отель",
-            "тур",
-            "туры",
-            "сибирь",
-        }
-
-        for raw_line in text.splitlines():
-            line = raw_line.strip()
-            line_lower = line.lower()
+        for raw_line in text_lower.splitlines():
+            line_lower = raw_line.strip()
 
             # Ищем только явные строки про вылет (чтобы не ловить "из" в обычном тексте)
             if "вылет" not in line_lower and "departure" not in line_lower:
@@ -375,22 +646,18 @@ class FlightSearchAnalyzer:
             if " из" not in line_lower and " from" not in line_lower:
                 continue
 
-            m = re.search(
-                r"(?:вылет|departure)\s*(?:из|from)\s*[:\-]?\s*(.*)$",
-                line_lower,
-                flags=re.IGNORECASE,
-            )
+            m = _DEPARTURE_RE.search(line_lower)
             rest = m.group(1) if m else line_lower
 
             # приоритет: первый "похожий на город" хэштег/токен после "вылет из"
-            candidates = re.findall(r"#([a-zа-яё][\w\-]{2,})", rest, flags=re.IGNORECASE)
+            candidates = _HASHTAG_CITY_RE.findall(rest)
             if not candidates:
-                candidates = re.findall(r"[a-zа-яё][a-zа-яё\-]{2,}", rest, flags=re.IGNORECASE)
+                candidates = _WORD_CITY_RE.findall(rest)
 
             value = None
             for c in candidates:
-                c_norm = c.strip().lower()
-                if c_norm in stopwords:
+                c_norm = c.strip()
+                if c_norm in _DEPARTURE_STOPWORDS:
                     continue
                 value = c_norm
                 break
@@ -407,67 +674,33 @@ class FlightSearchAnalyzer:
 
         return {"explicit": False, "is_moscow": None, "value": None}
 
-    def extract_months_from_text(self, text: str) -> List[int]:
-        """Извлекает упомянутые месяцы"""
-        months = []
-        text_lower = text.lower()
-
-        month_names = {
-            "январ": 1,
-            "феврал": 2,
-            "март": 3,
-            "апрел": 4,
-            "май": 5,
-            "мая": 5,
-            "июн": 6,
-            "июл": 7,
-            "август": 8,
-            "сентябр": 9,
-            "октябр": 10,
-            "ноябр": 11,
-            "декабр": 12,
-        }
-
-        for name, num in month_names.items():
-            if name in text_lower:
-                months.append(num)
-
-        return months
-
     def is_relevant(self, text: str) -> Tuple[bool, Dict[str, Any]]:
         """Проверяет релевантность сообщения"""
         if not text or len(text) < MIN_TEXT_LENGTH:
             return False, {}
 
-        # Проверяем наличие Индии
-        if not self.has_india_destination(text):
+        text_lower = text.lower()
+
+        # Быстрый отсев: большинство сообщений вообще не упоминают Индию
+        if not any(k in text_lower for k in _DEST_LITERALS):
             return False, {}
 
-        # Исключаем круизы
-        exclude_keywords = [
-            "круиз",
-            "круизы",
-            "cruise",
-            "корабль",
-            "ship",
-            "теплоход",
-        ]
-        if any(keyword in text.lower() for keyword in exclude_keywords):
+        # Проверяем наличие Индии и исключаем круизы
+        destinations, excluded = self._scan_keywords(text_lower)
+        if not destinations or excluded:
             return False, {}
 
         # Фильтр по вылету: если явно НЕ Москва — исключаем
-        departure = self._detect_departure(text)
+        departure = self._detect_departure(text_lower)
         if departure.get("explicit") and departure.get("is_moscow") is False:
             return False, {}
 
-        # Извлекаем данные
-        all_dates = self.extract_dates(text)
-        mentioned_months = self.extract_months_from_text(text)
-        price = self.extract_price(text)
+        # Извлекаем даты и упоминания месяцев — одним проходом
+        all_dates, mentioned_months = self.scan_dates(text_lower)
 
         # Анализируем даты
         target_month_dates = [
-            d for d in all_dates if d.get("month") == TARGET_MONTH
+            d for d in all_dates if d.month == TARGET_MONTH
         ]
         has_target_month_date = len(target_month_dates) > 0
         has_any_date = len(all_dates) > 0
@@ -475,80 +708,66 @@ class FlightSearchAnalyzer:
 
         # Логика отбора
         if has_target_month_date:
-            return True, {
-                "destinations": list(
-                    set(re.findall(DEST_PATTERN, text.lower()))
-                ),
-                "target_month_dates": target_month_dates,
-                "price": price,
-                "departure": departure,
-                "reason": "exact_dates",
-            }
+            reason = "exact_dates"
         elif has_march_mention and SEND_IF_NO_DATE:
-            return True, {
-                "destinations": list(
-                    set(re.findall(DEST_PATTERN, text.lower()))
-                ),
-                "target_month_dates": [],
-                "price": price,
-                "departure": departure,
-                "reason": "march_mentioned",
-            }
+            reason = "march_mentioned"
         elif not has_any_date and SEND_IF_NO_DATE:
-            return True, {
-                "destinations": list(
-                    set(re.findall(DEST_PATTERN, text.lower()))
-                ),
-                "target_month_dates": [],
-                "price": price,
-                "departure": departure,
-                "reason": "no_dates",
-            }
+            reason = "no_dates"
+        else:
+            return False, {}
 
-        return False, {}
+        # Цена нужна только для уведомления — ищем её лишь у принятых сообщений
+        price = self.extract_price(text_lower)
+
+        # Список направлений уже собран при сканировании ключевых слов —
+        # повторно текст не сканируем
+        return True, {
+            "destinations": destinations,
+            "target_month_dates": target_month_dates,
+            "price": price,
+            "departure": departure,
+            "reason": reason,
+        }
 
 
-async def monitor_channels():
-    """Основная функция мониторинга"""
-    logger.info("=" * 50)
-    logger.info("Starting flight monitoring cycle")
-    logger.info(f"Looking for flights to India/Goa in March {TARGET_YEAR}")
-    logger.info("=" * 50)
+@dataclass(slots=True)
+class FoundMessage:
+    """Найденное сообщение, уже подготовленное к отправке"""
 
-    # Инициализация файлового хранилища
-    state = FileState(STATE_FILE)
+    channel: str
+    preview: str
+    link: str
+    summary: str
 
-    # Подключение к Telegram
-    client = TelegramClient(SESSION_NAME, api_id, api_hash)
-    await client.start(phone=phone_number)
 
-    analyzer = FlightSearchAnalyzer()
+async def _process_channel(
+    client: TelegramClient,
+    channel: str,
+    state: State,
+    analyzer: FlightSearchAnalyzer,
+    sem: asyncio.Semaphore,
+) -> List[FoundMessage]:
+    """Проверяет один канал и возвращает найденные совпадения"""
     found_messages = []
-
-    # Фильтруем каналы
-    valid_channels = []
-    for ch in CHANNELS:
-        cleaned = clean_channel(ch)
-        if cleaned:
-            valid_channels.append(cleaned)
-
-    for channel in valid_channels:
+    processed_ids = []
+    async with sem:
         try:
             logger.info(f"📡 Checking channel: {channel}")
 
-            # Получаем последние сообщения
+            # Получаем новые сообщения (от новых к старым) и обрабатываем их
+            # по мере поступления; min_id отсекает уже просмотренные на стороне
+            # сервера. Без reverse: если last_id устарел (state.json в Actions не
+            # сохраняется между запусками), всегда смотрим 200 самых свежих постов,
+            # а не одно и то же старое окно сразу после last_id.
             last_id = state.get_last_id(channel)
-            messages = []
-            async for msg in client.iter_messages(channel, min_id=last_id, limit=200):
-                messages.append(msg)
-
-            messages.sort(key=lambda x: x.id)
-            new_messages = [m for m in messages if m.id > last_id]
-
-            if new_messages:
-                logger.info(f"Found {len(new_messages)} new messages")
+            max_id = last_id
+            new_count = 0
+            async for msg in client.iter_messages(
+                channel, min_id=last_id, limit=200
+            ):
+                new_count += 1
+                max_id = max(max_id, msg.id)
 
-            for msg in new_messages:
                 if state.is_duplicate(channel, msg.id):
                     continue
 
@@ -562,7 +781,7 @@ async def monitor_channels():
                         if details.get("target_month_dates"):
                             date_str = ", ".join(
                                 [
-                                    f"{d['day']:02d}.{d['month']:02d}"
+                                    f"{d.day:02d}.{d.month:02d}"
                                     for d in details["target_month_dates"]
                                 ]
                             )
@@ -587,65 +806,149 @@ async def monitor_channels():
                         )
 
                         found_messages.append(
-                            {
-                                "channel": channel,
-                                "preview": preview,
-                                "link": f"https://t.me/{channel}/{msg.id}",
-                                "summary": f"📅 {date_str} | ✈️ {dest_str} | 💰 {price_str}",
-                            }
+                            FoundMessage(
+                                channel=channel,
+                                preview=preview,
+                                link=f"https://t.me/{channel}/{msg.id}",
+                                summary=f"📅 {date_str} | ✈️ {dest_str} | 💰 {price_str}",
+                            )
                         )
 
-                state.mark_processed(channel, msg.id)
+                processed_ids.append(msg.id)
+
+            if new_count:
+                logger.info(f"Found {new_count} new messages in {channel}")
 
             # Обновляем последний ID
-            if new_messages:
-                max_id = max(m.id for m in new_messages)
+            if max_id > last_id:
                 state.set_last_id(channel, max_id)
 
         except Exception as e:
             logger.error(f"Error checking {channel}: {e}")
 
-    # Отправка результатов через бота (а не через клиента)
-    if found_messages:
-        for msg in found_messages:
-            ch = html.escape(msg["channel"])
-            summary = html.escape(msg["summary"])
-            preview = html.escape(msg["preview"])
-            link = msg["link"]
+        finally:
+            # Отмечаем обработанные от старых к новым, чтобы в ограниченной
+            # очереди FileState оставались самые свежие ID
+            for message_id in reversed(processed_ids):
+                state.mark_processed(channel, message_id)
+
+            # Сохраняем состояние один раз на канал (и при ошибке — чтобы не
+            # потерять прогресс). Хранилище синхронное и не уступает управление,
+            # поэтому параллельные корутины каналов не перемешают его запись.
+            state.flush()
+
+    # Сообщения приходили от новых к старым — уведомления шлём в хронологическом порядке
+    found_messages.reverse()
+    return found_messages
+
 
-            text = f"✈️ <b>{ch}</b>\n"
-            text += f"<i>{summary}</i>\n\n"
-            text += f"{preview}\n\n"
-            text += f'<a href="{link}">👉 Открыть пост</a>'
+def _open_state(config: Config) -> State:
+    """Инициализация хранилища состояния"""
+    if config.state_backend == "sqlite":
+        return SqliteState(STATE_DB_FILE, seed_file=STATE_FILE)
+    return FileState(STATE_FILE)
 
-            # Отправляем через бота
-            send_telegram_message(text)
 
-        logger.info(f"Sent {len(found_messages)} matches via bot")
+async def monitor_channels(
+    config: Config,
+    client: TelegramClient,
+    state: State,
+    analyzer: FlightSearchAnalyzer,
+):
+    """Один цикл мониторинга (клиент и хранилище живут между циклами)"""
+    logger.info("=" * 50)
+    logger.info("Starting flight monitoring cycle")
+    logger.info(f"Looking for flights to India/Goa in March {TARGET_YEAR}")
+    logger.info("=" * 50)
+
+    # Фильтруем каналы
+    valid_channels = []
+    for ch in CHANNELS:
+        cleaned = clean_channel(ch)
+        if cleaned:
+            valid_channels.append(cleaned)
+
+    # Каналы независимы — опрашиваем их параллельно
+    sem = asyncio.Semaphore(CHANNEL_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_process_channel(client, ch, state, analyzer, sem) for ch in valid_channels),
+        return_exceptions=True,
+    )
+
+    found_messages = []
+    for channel, result in zip(valid_channels, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Error checking {channel}: {result}")
+            continue
+        found_messages.extend(result)
+
+    # Отправка результатов через бота (а не через клиента)
+    if found_messages:
+        # Каждое сообщение собираем одной f-строкой, без цепочки +=
+        texts = [
+            f"✈️ <b>{html.escape(msg.channel)}</b>\n"
+            f"<i>{html.escape(msg.summary)}</i>\n\n"
+            f"{html.escape(msg.preview)}\n\n"
+            f'<a href="{msg.link}">👉 Открыть пост</a>'
+            for msg in found_messages
+        ]
+
+        # Отправляем через бота
+        sent = await send_telegram_messages(config, texts)
+        logger.info(f"Sent {sent}/{len(found_messages)} matches via bot")
     else:
         logger.info("No matches found")
-        # Отправляем уведомление через бота
-        send_telegram_message(
-            html.escape(
-                f"🔍 Мониторинг: новых предложений в Индию на март {TARGET_YEAR} не найдено"
+        # Отправляем уведомление через бота — только при разовом запуске:
+        # в постоянном режиме оно приходило бы на каждом цикле
+        if not config.monitor_interval:
+            await send_telegram_message(
+                config,
+                html.escape(
+                    f"🔍 Мониторинг: новых предложений в Индию на март {TARGET_YEAR} не найдено"
+                ),
             )
-        )
 
-    await client.disconnect()
     logger.info("Monitoring cycle completed")
 
 
 async def main():
+    config = _load_config()
+
+    if os.path.exists(SESSION_FILE):
+        os.chmod(SESSION_FILE, 0o600)  # правильные права доступа
+
     try:
-        await monitor_channels()
+        # Хранилище открываем до подключения к Telegram: если оно не открылось,
+        # клиент даже не создаётся. У каждого ресурса свой finally — ошибка при
+        # закрытии одного не мешает закрыть другой
+        state = _open_state(config)
+        try:
+            # Подключение к Telegram — один раз, а не на каждый цикл:
+            # MTProto-рукопожатие и авторизация дороже самого цикла
+            client = TelegramClient(SESSION_NAME, config.api_id, config.api_hash)
+            try:
+                await client.start(phone=config.phone_number)
+                analyzer = FlightSearchAnalyzer()
+
+                while True:
+                    await monitor_channels(config, client, state, analyzer)
+                    if not config.monitor_interval:
+                        break
+                    await asyncio.sleep(config.monitor_interval)
+            finally:
+                await client.disconnect()
+        finally:
+            state.close()
     except Exception as e:
         logger.error(f"Fatal error: {e}")
         # Пробуем отправить ошибку через бота
-        if bot_token:
-            send_telegram_message(
-                html.escape(f"❌ Ошибка мониторинга: {str(e)[:200]}")
+        if config.bot_token:
+            await send_telegram_message(
+                config, html.escape(f"❌ Ошибка мониторинга: {str(e)[:200]}")
             )
         raise
+    finally:
+        _TG_SESSION.close()
 
 
 if __name__ == "__main__":